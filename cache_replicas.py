@@ -0,0 +1,288 @@
+import functools
+import hashlib
+import inspect
+import io
+import os
+import struct
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import pyarrow as pa
+import streamlit as st
+
+# ————————————————
+# Caché compartida entre réplicas
+# ————————————————
+
+# Subir este número cuando cambie el esquema de los frames guardados (p. ej.
+# columnas derivadas nuevas), para que réplicas de versiones distintas no
+# compartan resultados incompatibles durante un despliegue.
+VERSION_CACHE = 1
+
+class BackendCache(ABC):
+    """Almacén clave -> bytes con expiración, compartible entre réplicas."""
+
+    @abstractmethod
+    def get(self, clave):
+        """Devuelve los bytes guardados o ``None`` si no hay entrada vigente."""
+
+    @abstractmethod
+    def set(self, clave, valor, ttl):
+        """Guarda ``valor`` durante ``ttl`` segundos."""
+
+    @abstractmethod
+    def delete(self, clave):
+        """Elimina la entrada, si existe."""
+
+class BackendMemoria(BackendCache):
+    """Almacén en el propio proceso (no se comparte entre réplicas)."""
+
+    def __init__(self, max_entradas=128):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()  # clave -> (expira, valor)
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] < time.time():
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return entrada[1]
+
+    def set(self, clave, valor, ttl):
+        with self._lock:
+            self._entradas[clave] = (time.time() + ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def delete(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+class BackendDirectorio(BackendCache):
+    """Un archivo por clave en un directorio local o montado en red.
+
+    Cada ``intervalo_limpieza`` segundos, una escritura borra las entradas
+    vencidas y los temporales huérfanos, y recorta el directorio a
+    ``max_bytes`` eliminando primero los archivos más antiguos.
+    """
+
+    def __init__(self, directorio, max_bytes=512 * 1024 * 1024, intervalo_limpieza=300,
+                 edad_max_temporales=3600):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.intervalo_limpieza = intervalo_limpieza
+        self.edad_max_temporales = edad_max_temporales
+        self._proxima_limpieza = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, hashlib.sha1(clave.encode()).hexdigest() + ".arrows")
+
+    def get(self, clave):
+        try:
+            with open(self._ruta(clave), 'rb') as f:
+                datos = f.read()
+        except OSError:
+            return None
+        try:
+            (expira,) = struct.unpack_from('<d', datos)
+        except struct.error:
+            self.delete(clave)
+            return None
+        if expira < time.time():
+            self.delete(clave)
+            return None
+        return datos[8:]
+
+    def set(self, clave, valor, ttl):
+        # Escritura atómica: otras réplicas nunca leen un archivo a medias.
+        fd, tmp = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(struct.pack('<d', time.time() + ttl))
+                f.write(valor)
+            os.replace(tmp, self._ruta(clave))
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self._limpiar_si_toca()
+
+    def _limpiar_si_toca(self):
+        ahora = time.time()
+        with self._lock:
+            if ahora < self._proxima_limpieza:
+                return
+            self._proxima_limpieza = ahora + self.intervalo_limpieza
+        self.limpiar(ahora)
+
+    def limpiar(self, ahora=None):
+        """Borra entradas vencidas o ilegibles, temporales viejos y el exceso de tamaño."""
+        ahora = time.time() if ahora is None else ahora
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return
+        vigentes = []  # (mtime, bytes, ruta)
+        for nombre in nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if nombre.endswith(".tmp"):
+                    if os.path.getmtime(ruta) < ahora - self.edad_max_temporales:
+                        os.remove(ruta)
+                elif nombre.endswith(".arrows"):
+                    with open(ruta, 'rb') as f:
+                        cabecera = f.read(8)
+                    if len(cabecera) < 8 or struct.unpack('<d', cabecera)[0] < ahora:
+                        os.remove(ruta)
+                    else:
+                        estado = os.stat(ruta)
+                        vigentes.append((estado.st_mtime, estado.st_size, ruta))
+            except OSError:
+                # Otra réplica pudo borrarlo o reemplazarlo entretanto.
+                continue
+        total = sum(tamano for _, tamano, _ in vigentes)
+        for _, tamano, ruta in sorted(vigentes):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except OSError:
+                continue
+            total -= tamano
+
+    def delete(self, clave):
+        try:
+            os.remove(self._ruta(clave))
+        except OSError:
+            pass
+
+class BackendRedis(BackendCache):
+    """Redis (u otro servidor compatible) compartido por todas las réplicas."""
+
+    def __init__(self, url=None, cliente=None):
+        import redis
+        self._errores = redis.RedisError
+        self.cliente = cliente if cliente is not None else redis.Redis.from_url(url)
+
+    def get(self, clave):
+        try:
+            return self.cliente.get(clave)
+        except self._errores:
+            return None
+
+    def set(self, clave, valor, ttl):
+        try:
+            self.cliente.set(clave, valor, ex=max(1, int(ttl)))
+        except self._errores:
+            pass
+
+    def delete(self, clave):
+        try:
+            self.cliente.delete(clave)
+        except self._errores:
+            pass
+
+@st.cache_resource
+def obtener_backend_cache():
+    """Backend según CUIPO_CACHE_BACKEND: memoria, directorio o redis.
+
+    Sin la variable no hay caché compartida y ``st.cache_data`` es la única
+    caché, como en una instalación de una sola réplica.
+    """
+    tipo = os.environ.get("CUIPO_CACHE_BACKEND", "").lower()
+    if tipo == "memoria":
+        return BackendMemoria()
+    if tipo == "directorio":
+        return BackendDirectorio(os.environ.get(
+            "CUIPO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cuipo_cache")
+        ))
+    if tipo == "redis":
+        return BackendRedis(os.environ.get("CUIPO_REDIS_URL", "redis://localhost:6379/0"))
+    return None
+
+def _serializar_frames(resultado):
+    """Serializa un DataFrame o una tupla de DataFrames como flujos Arrow IPC."""
+    es_tupla = isinstance(resultado, tuple)
+    buf = io.BytesIO()
+    buf.write(b'T' if es_tupla else b'D')
+    for df in (resultado if es_tupla else (resultado,)):
+        tabla = pa.Table.from_pandas(df)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+        datos = sink.getvalue()
+        buf.write(struct.pack('<Q', datos.size))
+        buf.write(datos)
+    return buf.getvalue()
+
+def _deserializar_frames(datos):
+    if datos[:1] not in (b'T', b'D'):
+        raise ValueError("Encabezado de caché desconocido")
+    vista = memoryview(datos)
+    frames, pos = [], 1
+    while pos < len(vista):
+        (largo,) = struct.unpack_from('<Q', vista, pos)
+        pos += 8
+        if pos + largo > len(vista):
+            raise ValueError("Entrada de caché truncada")
+        frames.append(pa.ipc.open_stream(pa.py_buffer(vista[pos:pos + largo])).read_all().to_pandas())
+        pos += largo
+    if datos[:1] == b'T':
+        return tuple(frames)
+    if len(frames) != 1:
+        raise ValueError("Entrada de caché truncada")
+    return frames[0]
+
+def _version_funcion(func):
+    try:
+        fuente = inspect.getsource(func)
+    except (OSError, TypeError):
+        fuente = func.__qualname__
+    return hashlib.sha1(fuente.encode()).hexdigest()[:12]
+
+def cache_compartido(ttl):
+    """Guarda el resultado en el backend compartido, serializado con Arrow IPC.
+
+    Se usa debajo de ``st.cache_data``: la caché de Streamlit sigue sirviendo
+    los aciertos locales y esta capa evita repetir descargas entre réplicas.
+    Una entrada ilegible se descarta y se trata como un fallo de caché.
+    """
+    def decorador(func):
+        prefijo = f"cuipo:v{VERSION_CACHE}:{func.__name__}:{_version_funcion(func)}"
+
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            backend = obtener_backend_cache()
+            if backend is None:
+                return func(*args, **kwargs)
+            firma = repr((args, sorted(kwargs.items())))
+            clave = f"{prefijo}:{hashlib.sha1(firma.encode()).hexdigest()}"
+            datos = backend.get(clave)
+            if datos is not None:
+                try:
+                    return _deserializar_frames(datos)
+                except (pa.ArrowException, struct.error, ValueError):
+                    backend.delete(clave)
+            resultado = func(*args, **kwargs)
+            try:
+                backend.set(clave, _serializar_frames(resultado), ttl)
+            except (pa.ArrowException, OSError):
+                # Columnas que Arrow no sabe tipar o almacén no disponible:
+                # se sirve el resultado sin compartir.
+                pass
+            return resultado
+        return envoltura
+    return decorador
@@ -1,9 +1,14 @@
 import streamlit as st
 import pandas as pd
-import requests
 import io
 import altair as alt
 import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from cache_replicas import cache_compartido
+from ingesta import ClienteSocrata, texto_canonico
 
 # ————————————————
 # Inyectar logos en esquinas
@@ -38,22 +43,60 @@ def cargar_tablas_control():
     )
     return df_mun, df_dep, df_per
 
+@st.cache_resource
+def obtener_cliente():
+    return ClienteSocrata(app_token=os.environ.get("SOCRATA_APP_TOKEN"))
+
+# ————————————————
+# Normalización al ingerir
+# ————————————————
+
+CODIGOS_RESUMEN_INGRESOS = ["1","1.1","1.1.01.01.200","1.1.01.02.104","1.1.01.02.200","1.1.01.02.300","1.1.02.06.001","1.2.06","1.2.07"]
+VIGENCIAS_CONSOLIDADO = [
+    "VIGENCIA ACTUAL","RESERVAS","VIGENCIAS FUTURAS - RESERVAS",
+    "CUENTAS POR PAGAR","VIGENCIAS FUTURAS - VIGENCIA ACTUAL"
+]
+# Columnas añadidas al ingerir; no se muestran ni se exportan como datos brutos.
+COLUMNAS_DERIVADAS = [
+    'vigencia_canonica', 'nombre_cuenta_canonico', 'is_vigencia_actual',
+    'is_vigencia_consolidado', 'is_gastos_root', 'is_ingresos_summary_code', 'is_ingresos_root'
+]
+
+def normalizar_ingresos(df):
+    """Agrega banderas precalculadas a los datos de ingresos."""
+    df['is_ingresos_summary_code'] = texto_canonico(df, 'ambito_codigo').isin(CODIGOS_RESUMEN_INGRESOS)
+    df['is_ingresos_root'] = texto_canonico(df, 'ambito_nombre').eq('INGRESOS')
+    return df
+
+def normalizar_gastos(df):
+    """Agrega textos canónicos y banderas precalculadas a los datos de gastos."""
+    df['vigencia_canonica'] = texto_canonico(df, 'nom_vigencia_del_gasto')
+    df['nombre_cuenta_canonico'] = texto_canonico(df, 'nombre_cuenta')
+    df['is_vigencia_actual'] = df['vigencia_canonica'].eq('VIGENCIA ACTUAL')
+    df['is_vigencia_consolidado'] = df['vigencia_canonica'].isin(VIGENCIAS_CONSOLIDADO)
+    df['is_gastos_root'] = df['nombre_cuenta_canonico'].eq('GASTOS')
+    return df
+
+def sin_columnas_derivadas(df):
+    return df.drop(columns=[c for c in COLUMNAS_DERIVADAS if c in df.columns])
+
 @st.cache_data(ttl=600, show_spinner=False)
+@cache_compartido(ttl=600)
 def obtener_ingresos(codigo_entidad, periodo=None):
-    url = "https://www.datos.gov.co/resource/22ah-ddsj.json"
+    url = "https://www.datos.gov.co/resource/22ah-ddsj.csv"
     where = f"codigo_entidad='{codigo_entidad}'"
     if periodo:
         where += f" AND periodo='{periodo}'"
     params = {"$where": where, "$limit": 50000}
-    r = requests.get(url, params=params, timeout=30)
-    r.raise_for_status()
-    df = pd.DataFrame(r.json())
-    for col in ['valor', 'presupuesto_inicial', 'presupuesto_definitivo']:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
-    return df
+    if not periodo:
+        # El histórico sólo usa estas columnas; evita traer todo como texto.
+        params["$select"] = "periodo,ambito_nombre,presupuesto_definitivo"
+    return obtener_cliente().obtener_csv(
+        url, params, ['valor', 'presupuesto_inicial', 'presupuesto_definitivo'], transformar=normalizar_ingresos
+    )
 
 @st.cache_data(ttl=600, show_spinner=False)
+@cache_compartido(ttl=600)
 def obtener_datos_gastos(codigo_entidad, periodo):
     cols = [
         "periodo", "codigo_entidad", "nombre_entidad",
@@ -63,22 +106,203 @@ def obtener_datos_gastos(codigo_entidad, periodo):
         f"codigo_entidad='{codigo_entidad}' AND periodo='{periodo}'"
     )
     params = {"$select": ",".join(cols), "$where": where, "$limit": 10000}
-    r = requests.get("https://www.datos.gov.co/resource/4f7r-epif.csv", params=params, timeout=30)
-    r.raise_for_status()
-    return pd.read_csv(io.StringIO(r.text))
+    return obtener_cliente().obtener_csv(
+        "https://www.datos.gov.co/resource/4f7r-epif.csv", params, ['compromisos', 'pagos', 'obligaciones'],
+        transformar=normalizar_gastos
+    )
+
+def _sumar_por_entidad(df):
+    return df.groupby('nombre_entidad', as_index=False)['presupuesto_definitivo'].sum()
 
 @st.cache_data(ttl=300)
+@cache_compartido(ttl=300)
 def fetch_account_data(periodo: str, ambito_code: str):
-    """Obtiene registros de la API para un período y ambito_codigo."""
-    url = "https://www.datos.gov.co/resource/22ah-ddsj.json"
-    params = {"$where": f"periodo='{periodo}' AND ambito_codigo='{ambito_code}'", "$limit": 50000}
-    resp = requests.get(url, params=params, timeout=30)
-    resp.raise_for_status()
-    df = pd.DataFrame(resp.json())
-    for col in ['presupuesto_inicial', 'presupuesto_definitivo']:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
-    return df
+    """Presupuesto definitivo por entidad para un período y ambito_codigo.
+
+    La suma por entidad se calcula bloque a bloque mientras se lee la respuesta.
+    """
+    url = "https://www.datos.gov.co/resource/22ah-ddsj.csv"
+    params = {
+        "$select": "nombre_entidad,presupuesto_definitivo",
+        "$where": f"periodo='{periodo}' AND ambito_codigo='{ambito_code}'",
+        "$limit": 50000,
+    }
+    return obtener_cliente().obtener_csv(
+        url, params, ['presupuesto_definitivo'], reducir=_sumar_por_entidad
+    )
+
+# ————————————————
+# Resúmenes derivados
+# ————————————————
+
+def huella_dataframe(df):
+    """Huella del contenido de un DataFrame (columnas, índice y valores)."""
+    h = hashlib.sha1()
+    h.update("|".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+def _tamano_resultado(valor):
+    """Bytes aproximados de un resultado derivado (frames, HTML y Excel)."""
+    total = 0
+    for v in valor.values():
+        if isinstance(v, pd.DataFrame):
+            total += int(v.memory_usage(deep=True).sum())
+        elif isinstance(v, (bytes, str)):
+            total += len(v)
+    return total
+
+class CacheResultados:
+    """Caché LRU de resultados derivados, acotada por tamaño total en bytes.
+
+    La clave combina la huella del dataset de origen con los parámetros de la
+    transformación; los valores guardados son compartidos y no deben mutarse.
+    Los resultados mayores que ``max_bytes`` se devuelven sin guardarse.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()  # clave -> (valor, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, calcular):
+        with self._lock:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                return self._entradas[clave][0]
+        valor = calcular()
+        tamano = _tamano_resultado(valor)
+        if tamano > self.max_bytes:
+            return valor
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entradas[clave] = (valor, tamano)
+            self._bytes += tamano
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._entradas.popitem(last=False)[1][1]
+        return valor
+
+@st.cache_resource
+def obtener_cache_resultados():
+    return CacheResultados()
+
+def _excel_bytes(hojas):
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine='openpyxl') as writer:
+        for nombre, df in hojas.items():
+            df.to_excel(writer, sheet_name=nombre, index=False)
+    return buf.getvalue()
+
+def _resumir_ingresos(df_i):
+    df_brutos = sin_columnas_derivadas(df_i)
+    # Filtrar ámbitos
+    df_fil = df_brutos[df_i['is_ingresos_summary_code']]
+
+    # Resumen correcto
+    resumen = df_fil.copy()
+    # Convertir a millones
+    for col in ['presupuesto_inicial','presupuesto_definitivo']:
+        if col in resumen.columns:
+            resumen[col] = resumen[col] / 1e6
+    # Calcular total (millones)
+    total_ing = resumen['presupuesto_definitivo'].sum() if 'presupuesto_definitivo' in resumen.columns else 0.0
+    # Renombrar columnas
+    resumen = resumen.rename(columns={
+        'presupuesto_inicial':'Presupuesto Inicial',
+        'presupuesto_definitivo':'Presupuesto Definitivo',
+        'periodo':'Periodo',
+        'codigo_entidad':'Código Entidad',
+        'nombre_entidad':'Nombre Entidad',
+        'ambito_codigo':'Ámbito Código',
+        'ambito_nombre':'Ámbito Nombre',
+        'nombre_cuenta':'Nombre Cuenta'
+    })
+    # Formatear para despliegue
+    tabla = resumen.copy()
+    if 'Presupuesto Inicial' in tabla.columns:
+        tabla['Presupuesto Inicial'] = tabla['Presupuesto Inicial'].map(format_cop)
+    if 'Presupuesto Definitivo' in tabla.columns:
+        tabla['Presupuesto Definitivo'] = tabla['Presupuesto Definitivo'].map(format_cop)
+
+    return {
+        'brutos': df_brutos,
+        'tabla_html': tabla.to_html(index=False, escape=False),
+        'total_ing': total_ing,
+        'excel_brutos': _excel_bytes({'Datos Brutos': df_brutos}),
+    }
+
+def resumir_ingresos(df_i, huella):
+    """Resumen de ingresos filtrados, memoizado por huella del dataset."""
+    clave = ('ingresos', huella, tuple(CODIGOS_RESUMEN_INGRESOS))
+    return obtener_cache_resultados().obtener(clave, lambda: _resumir_ingresos(df_i))
+
+def _resumir_gastos(df_raw):
+    df_brutos = sin_columnas_derivadas(df_raw)
+    # Reemplaza la lista a continuación con los códigos de cuenta que deseas filtrar
+    cuentas_filtrar = df_raw['cuenta'].unique().tolist()  # O especifica una lista como ['1', '2', ...]
+    df_filtered = df_raw[df_raw['cuenta'].isin(cuentas_filtrar) & df_raw['is_vigencia_actual']]
+
+    resumen = (
+        df_filtered[~df_filtered['is_gastos_root']]
+        .groupby(['cuenta','nombre_cuenta'], as_index=False)[['compromisos','pagos','obligaciones']]
+        .sum()
+    )
+    tot = resumen[['compromisos','pagos','obligaciones']].sum()
+    resumen = pd.concat([resumen, pd.DataFrame([{'cuenta':'','nombre_cuenta':'TOTAL', **tot.to_dict()}])], ignore_index=True)
+
+    resumen_disp = resumen.rename(columns={
+        'cuenta':'Cuenta','nombre_cuenta':'Nombre cuenta',
+        'compromisos':'Compromisos','pagos':'Pagos','obligaciones':'Obligaciones'
+    })
+    resumen_disp[['Compromisos','Pagos','Obligaciones']] = (resumen_disp[['Compromisos','Pagos','Obligaciones']]/1e6).applymap(format_cop)
+
+    gastos = (
+        df_filtered[df_filtered['is_gastos_root']]
+        .groupby(['cuenta','nombre_cuenta'], as_index=False)[['compromisos','pagos','obligaciones']]
+        .sum()
+    )
+    gastos_disp = gastos.drop(columns=['cuenta','nombre_cuenta']).rename(columns={
+        'compromisos':'Compromisos','pagos':'Pagos','obligaciones':'Obligaciones'
+    })
+    gastos_disp[['Compromisos','Pagos','Obligaciones']] = (gastos_disp[['Compromisos','Pagos','Obligaciones']]/1e6).applymap(format_cop)
+
+    consolidado = (
+        df_raw[df_raw['is_vigencia_consolidado'] & df_raw['is_gastos_root']]
+        .assign(nom_vigencia_del_gasto=lambda d: d['vigencia_canonica'].astype(str))
+        .groupby('nom_vigencia_del_gasto', as_index=False)[['compromisos','pagos','obligaciones']]
+        .sum()
+    )
+    tot_con = consolidado[['compromisos','pagos','obligaciones']].sum()
+    consolidado = pd.concat([consolidado, pd.DataFrame([{'nom_vigencia_del_gasto':'TOTAL', **tot_con.to_dict()}])], ignore_index=True)
+
+    consolidado_disp = consolidado.rename(columns={
+        'nom_vigencia_del_gasto':'Vigencia del gasto','compromisos':'Compromisos',
+        'pagos':'Pagos','obligaciones':'Obligaciones'
+    })
+    consolidado_disp[['Compromisos','Pagos','Obligaciones']] = (consolidado_disp[['Compromisos','Pagos','Obligaciones']]/1e6).applymap(format_cop)
+
+    return {
+        'brutos': df_brutos,
+        'resumen_html': resumen_disp.to_html(index=False),
+        'gastos_html': gastos_disp.to_html(index=False),
+        'consolidado_html': consolidado_disp.to_html(index=False),
+        'total_compromisos': tot_con['compromisos'],
+        'excel_brutos': _excel_bytes({'DatosBrutos': df_brutos}),
+        'excel_completo': _excel_bytes({
+            'DatosBrutos': df_brutos,
+            'Resumen': resumen_disp,
+            'DetalleGastos': gastos_disp,
+            'Consolidado': consolidado_disp,
+        }),
+    }
+
+def resumir_gastos(df_raw, huella):
+    """Resúmenes de ejecución de gastos, memoizados por huella del dataset."""
+    clave = ('gastos', huella, tuple(VIGENCIAS_CONSOLIDADO))
+    return obtener_cache_resultados().obtener(clave, lambda: _resumir_gastos(df_raw))
 
 # ————————————————
 # Carga inicial
@@ -144,64 +368,31 @@ if pagina == "Programación de Ingresos":
     if st.button("Cargar ingresos"):
         with st.spinner("Cargando datos..."):
             st.session_state['df_ingresos'] = obtener_ingresos(cod_ent, per)
+            st.session_state['huella_ingresos'] = huella_dataframe(st.session_state['df_ingresos'])
 
     if 'df_ingresos' in st.session_state:
         df_i = st.session_state['df_ingresos']
+        res_i = resumir_ingresos(df_i, st.session_state['huella_ingresos'])
         st.subheader("1. Datos brutos de ingresos")
-        st.dataframe(df_i, use_container_width=True)
+        st.dataframe(res_i['brutos'], use_container_width=True)
 
         # Descarga brutos
-        buf_raw = io.BytesIO()
-        with pd.ExcelWriter(buf_raw, engine='openpyxl') as writer:
-            df_i.to_excel(writer, index=False, sheet_name='Datos Brutos')
-        buf_raw.seek(0)
         st.download_button(
             "⬇️ Descargar datos brutos en Excel",
-            data=buf_raw,
+            data=res_i['excel_brutos'],
             file_name="datos_brutos_ingresos.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
 
-        # Filtrar ámbitos
-        codigos = ["1","1.1","1.1.01.01.200","1.1.01.02.104","1.1.01.02.200","1.1.01.02.300","1.1.02.06.001","1.2.06","1.2.07"]
-        ambito_series = df_i['ambito_codigo'] if 'ambito_codigo' in df_i.columns else pd.Series(['']*len(df_i))
-        df_fil = df_i[ambito_series.fillna('').astype(str).isin(codigos)]
-
-        # Resumen correcto
-        resumen = df_fil.copy()
-        # Convertir a millones
-        for col in ['presupuesto_inicial','presupuesto_definitivo']:
-            if col in resumen.columns:
-                resumen[col] = resumen[col] / 1e6
-        # Calcular total (millones)
-        total_ing = resumen['presupuesto_definitivo'].sum() if 'presupuesto_definitivo' in resumen.columns else 0.0
-        # Renombrar columnas
-        resumen = resumen.rename(columns={
-            'presupuesto_inicial':'Presupuesto Inicial',
-            'presupuesto_definitivo':'Presupuesto Definitivo',
-            'periodo':'Periodo',
-            'codigo_entidad':'Código Entidad',
-            'nombre_entidad':'Nombre Entidad',
-            'ambito_codigo':'Ámbito Código',
-            'ambito_nombre':'Ámbito Nombre',
-            'nombre_cuenta':'Nombre Cuenta'
-        })
-        # Formatear para despliegue
-        tabla = resumen.copy()
-        if 'Presupuesto Inicial' in tabla.columns:
-            tabla['Presupuesto Inicial'] = tabla['Presupuesto Inicial'].map(format_cop)
-        if 'Presupuesto Definitivo' in tabla.columns:
-            tabla['Presupuesto Definitivo'] = tabla['Presupuesto Definitivo'].map(format_cop)
-
         st.subheader("2. Resumen de ingresos filtrados (millones de pesos)")
-        st.markdown(tabla.to_html(index=False, escape=False), unsafe_allow_html=True)
+        st.markdown(res_i['tabla_html'], unsafe_allow_html=True)
         st.subheader("3. Total Presupuesto Definitivo (INGRESOS) (millones de pesos)")
-        st.metric("", format_cop(total_ing * 1e6))
+        st.metric("", format_cop(res_i['total_ing'] * 1e6))
 
         # Mostrar histórico
         if st.button("Mostrar histórico"):
             df_hist = obtener_ingresos(cod_ent)
-            df_hist = df_hist[df_hist['ambito_nombre'].str.upper()=='INGRESOS']
+            df_hist = df_hist[df_hist['is_ingresos_root']]
             df_hist['periodo_dt'] = pd.to_datetime(df_hist['periodo'], format='%Y%m%d', errors='coerce')
             df_hist['year'] = df_hist['periodo_dt'].dt.year
             df_hist['md'] = df_hist['periodo_dt'].dt.strftime('%m%d')
@@ -253,97 +444,38 @@ elif pagina == "Ejecución de Gastos":
 
     if st.button("Cargar datos"):
         st.session_state['df_gastos'] = obtener_datos_gastos(codigo_ent, periodo)
+        st.session_state['huella_gastos'] = huella_dataframe(st.session_state['df_gastos'])
 
     if 'df_gastos' in st.session_state:
         df_raw = st.session_state['df_gastos']
+        res_g = resumir_gastos(df_raw, st.session_state['huella_gastos'])
         st.subheader("### Datos brutos")
-        st.dataframe(df_raw.style.format({
+        st.dataframe(res_g['brutos'].style.format({
             'compromisos': format_cop,
             'pagos': format_cop,
             'obligaciones': format_cop
         }), use_container_width=True)
 
-        buf_raw = io.BytesIO()
-        with pd.ExcelWriter(buf_raw, engine='openpyxl') as writer:
-            df_raw.to_excel(writer, sheet_name='DatosBrutos', index=False)
         st.download_button(
             "⬇️ Descargar Datos Brutos (Excel)",
-            data=buf_raw,
+            data=res_g['excel_brutos'],
             file_name='datos_brutos_gastos.xlsx',
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
 
-        # Reemplaza la lista a continuación con los códigos de cuenta que deseas filtrar
-        cuentas_filtrar = df_raw['cuenta'].unique().tolist()  # O especifica una lista como ['1', '2', ...]
-        df_filtered = df_raw[
-            df_raw['cuenta'].isin(cuentas_filtrar) &
-            df_raw['nom_vigencia_del_gasto'].fillna('').str.strip().str.upper().eq('VIGENCIA ACTUAL')
-        ]
-
-        resumen = (
-            df_filtered
-            .groupby(['cuenta','nombre_cuenta'], as_index=False)[['compromisos','pagos','obligaciones']]
-            .sum()
-        )
-        resumen = resumen[resumen['nombre_cuenta'].str.upper() != 'GASTOS']
-        tot = resumen[['compromisos','pagos','obligaciones']].sum()
-        resumen = pd.concat([resumen, pd.DataFrame([{'cuenta':'','nombre_cuenta':'TOTAL', **tot.to_dict()}])], ignore_index=True)
-
-        resumen_disp = resumen.rename(columns={
-            'cuenta':'Cuenta','nombre_cuenta':'Nombre cuenta',
-            'compromisos':'Compromisos','pagos':'Pagos','obligaciones':'Obligaciones'
-        })
-        resumen_disp[['Compromisos','Pagos','Obligaciones']] = (resumen_disp[['Compromisos','Pagos','Obligaciones']]/1e6).applymap(format_cop)
-
         st.subheader("### Resumen de compromisos, pagos y obligaciones por cuenta (en millones de pesos)")
-        st.markdown(resumen_disp.to_html(index=False), unsafe_allow_html=True)
-
-        gastos = (
-            df_filtered[df_filtered['nombre_cuenta'].str.upper()=='GASTOS']
-            .groupby(['cuenta','nombre_cuenta'], as_index=False)[['compromisos','pagos','obligaciones']]
-            .sum()
-        )
-        gastos_disp = gastos.drop(columns=['cuenta','nombre_cuenta']).rename(columns={
-            'compromisos':'Compromisos','pagos':'Pagos','obligaciones':'Obligaciones'
-        })
-        gastos_disp[['Compromisos','Pagos','Obligaciones']] = (gastos_disp[['Compromisos','Pagos','Obligaciones']]/1e6).applymap(format_cop)
+        st.markdown(res_g['resumen_html'], unsafe_allow_html=True)
 
         st.subheader("### Detalle GASTOS (en millones de pesos)")
-        st.markdown(gastos_disp.to_html(index=False), unsafe_allow_html=True)
-
-        vigencias = [
-            "VIGENCIA ACTUAL","RESERVAS","VIGENCIAS FUTURAS - RESERVAS",
-            "CUENTAS POR PAGAR","VIGENCIAS FUTURAS - VIGENCIA ACTUAL"
-        ]
-        consolidado = (
-            df_raw[df_raw['nom_vigencia_del_gasto'].fillna('').str.strip().str.upper().isin(vigencias) &
-                   df_raw['nombre_cuenta'].fillna('').str.strip().str.upper().eq('GASTOS')]
-            .groupby('nom_vigencia_del_gasto', as_index=False)[['compromisos','pagos','obligaciones']]
-            .sum()
-        )
-        tot_con = consolidado[['compromisos','pagos','obligaciones']].sum()
-        consolidado = pd.concat([consolidado, pd.DataFrame([{'nom_vigencia_del_gasto':'TOTAL', **tot_con.to_dict()}])], ignore_index=True)
-
-        consolidado_disp = consolidado.rename(columns={
-            'nom_vigencia_del_gasto':'Vigencia del gasto','compromisos':'Compromisos',
-            'pagos':'Pagos','obligaciones':'Obligaciones'
-        })
-        consolidado_disp[['Compromisos','Pagos','Obligaciones']] = (consolidado_disp[['Compromisos','Pagos','Obligaciones']]/1e6).applymap(format_cop)
+        st.markdown(res_g['gastos_html'], unsafe_allow_html=True)
 
         st.subheader("### Consolidado de GASTOS por tipo de vigencia (en millones de pesos)")
-        st.markdown(consolidado_disp.to_html(index=False), unsafe_allow_html=True)
+        st.markdown(res_g['consolidado_html'], unsafe_allow_html=True)
 
-        st.metric("Total compromisos para todas las vigencias", format_cop(tot_con['compromisos']/1e6 * 1e6))
+        st.metric("Total compromisos para todas las vigencias", format_cop(res_g['total_compromisos']/1e6 * 1e6))
 
-        buf_all = io.BytesIO()
-        with pd.ExcelWriter(buf_all, engine='openpyxl') as writer:
-            df_raw.to_excel(writer, sheet_name='DatosBrutos', index=False)
-            resumen_disp.to_excel(writer, sheet_name='Resumen', index=False)
-            gastos_disp.to_excel(writer, sheet_name='DetalleGastos', index=False)
-            consolidado_disp.to_excel(writer, sheet_name='Consolidado', index=False)
-        buf_all.seek(0)
         st.download_button(
-            "⬇️ Descargar Todo (Excel)", data=buf_all,
+            "⬇️ Descargar Todo (Excel)", data=res_g['excel_completo'],
             file_name='ejecucion_gastos_completo.xlsx',
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
@@ -378,11 +510,7 @@ elif pagina == "Comparativa de Ingresos":
             st.warning("No hay datos para esa cuenta y período.")
             st.stop()
 
-        df_sum = (
-            df_acct.groupby('nombre_entidad', as_index=False)['presupuesto_definitivo']
-                   .sum()
-        )
-        df_sum = df_sum.merge(
+        df_sum = df_acct.merge(
             df_mun[['nombre_entidad','poblacion','categoria']],
             on='nombre_entidad',
             how='left'
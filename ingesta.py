@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# ————————————————
+# Lectura de datos.gov.co
+# ————————————————
+
+def _leer_csv_por_bloques(r, columnas_numericas=(), tamano_bloque=5000):
+    """Lee una respuesta CSV de Socrata por bloques, sin cargarla completa en memoria.
+
+    Cada bloque se devuelve con las columnas numéricas ya convertidas, de modo
+    que nunca se materializa la lista completa de registros como texto.
+    """
+    r.raw.decode_content = True
+    try:
+        lector = pd.read_csv(r.raw, dtype=str, chunksize=tamano_bloque, encoding='utf-8')
+        for bloque in lector:
+            for col in columnas_numericas:
+                if col in bloque.columns:
+                    bloque[col] = pd.to_numeric(bloque[col].str.replace(',', ''), errors='coerce')
+            yield bloque
+    except pd.errors.EmptyDataError:
+        return
+
+def _unir_bloques(bloques):
+    bloques = list(bloques)
+    if not bloques:
+        return pd.DataFrame()
+    return pd.concat(bloques, ignore_index=True)
+
+class ClienteSocrata:
+    """Cliente HTTP compartido para datos.gov.co.
+
+    Reutiliza una sesión con conexiones persistentes, envía el app token de
+    Socrata si está configurado y revalida con ETag/Last-Modified: si el
+    servidor responde 304 se devuelve el DataFrame ya descargado. Los frames
+    guardados para revalidar caducan a los ``ttl_validaciones`` segundos y su
+    tamaño total se limita a ``max_bytes_validaciones``.
+    """
+
+    def __init__(self, app_token=None, max_bytes_validaciones=32 * 1024 * 1024, ttl_validaciones=3600):
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adaptador)
+        self.session.headers["Accept"] = "text/csv"
+        if app_token:
+            self.session.headers["X-App-Token"] = app_token
+        self.max_bytes_validaciones = max_bytes_validaciones
+        self.ttl_validaciones = ttl_validaciones
+        self._validaciones = OrderedDict()  # clave -> (expira, etag, last_modified, df, bytes)
+        self._bytes_validaciones = 0
+        self._lock = threading.Lock()
+
+    def _previo(self, clave):
+        with self._lock:
+            previo = self._validaciones.get(clave)
+            if previo is not None and previo[0] < time.time():
+                self._bytes_validaciones -= self._validaciones.pop(clave)[4]
+                return None
+            return previo
+
+    def _guardar(self, clave, etag, modificado, df):
+        tamano = int(df.memory_usage(deep=True).sum())
+        if tamano > self.max_bytes_validaciones:
+            return
+        with self._lock:
+            anterior = self._validaciones.pop(clave, None)
+            if anterior is not None:
+                self._bytes_validaciones -= anterior[4]
+            self._validaciones[clave] = (time.time() + self.ttl_validaciones, etag, modificado, df, tamano)
+            self._bytes_validaciones += tamano
+            while self._bytes_validaciones > self.max_bytes_validaciones:
+                self._bytes_validaciones -= self._validaciones.popitem(last=False)[1][4]
+
+    def obtener_csv(self, url, params, columnas_numericas=(), tamano_bloque=5000, reducir=None, transformar=None):
+        """Descarga un CSV como DataFrame.
+
+        Si se indica ``reducir``, se aplica a cada bloque y de nuevo al unir los
+        resultados parciales, de modo que nunca se guardan los registros crudos.
+        ``transformar`` se aplica una vez al resultado antes de guardarlo. El
+        frame devuelto puede estar compartido y no debe mutarse.
+        """
+        clave = (
+            url, tuple(sorted(params.items())),
+            getattr(reducir, '__name__', None), getattr(transformar, '__name__', None)
+        )
+        previo = self._previo(clave)
+        headers = {}
+        if previo is not None:
+            _, etag, modificado, _, _ = previo
+            if etag:
+                headers["If-None-Match"] = etag
+            if modificado:
+                headers["If-Modified-Since"] = modificado
+        with self.session.get(url, params=params, headers=headers, timeout=30, stream=True) as r:
+            if r.status_code == 304 and previo is not None:
+                with self._lock:
+                    if clave in self._validaciones:
+                        # Revalidado: el frame sigue vigente otro ttl_validaciones.
+                        self._validaciones[clave] = (time.time() + self.ttl_validaciones,) + self._validaciones[clave][1:]
+                        self._validaciones.move_to_end(clave)
+                return previo[3]
+            r.raise_for_status()
+            bloques = _leer_csv_por_bloques(r, columnas_numericas, tamano_bloque)
+            if reducir is None:
+                df = _unir_bloques(bloques)
+            else:
+                df = _unir_bloques(reducir(b) for b in bloques)
+                if not df.empty:
+                    df = reducir(df)
+            etag, modificado = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        if transformar is not None:
+            df = transformar(df)
+        if etag or modificado:
+            self._guardar(clave, etag, modificado, df)
+        return df
+
+# ————————————————
+# Normalización de texto
+# ————————————————
+
+def texto_canonico(df, col):
+    """Texto sin espacios extremos y en mayúsculas, como categórica.
+
+    Las operaciones de texto se aplican sólo sobre los valores únicos.
+    """
+    if col not in df.columns:
+        return pd.Series(pd.Categorical([''] * len(df)), index=df.index)
+    codigos, valores = pd.factorize(df[col].fillna('').astype(str))
+    canon = pd.Index(valores, dtype=object).str.strip().str.upper()
+    categorias = canon.unique()
+    return pd.Series(
+        pd.Categorical.from_codes(categorias.get_indexer(canon)[codigos], categories=categorias),
+        index=df.index
+    )
@@ -0,0 +1,199 @@
+import os
+import struct
+import time
+
+import pandas as pd
+import pytest
+
+import cache_replicas as cr
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    b = cr.BackendMemoria()
+    monkeypatch.setattr(cr, "obtener_backend_cache", lambda: b)
+    return b
+
+
+# ————————————————
+# BackendDirectorio
+# ————————————————
+
+def test_directorio_guarda_y_lee(tmp_path):
+    b = cr.BackendDirectorio(str(tmp_path))
+    b.set("k", b"abc", 60)
+    assert b.get("k") == b"abc"
+    assert b.get("otra") is None
+
+
+def test_directorio_expira_y_borra_archivo(tmp_path):
+    b = cr.BackendDirectorio(str(tmp_path))
+    b.set("k", b"abc", -1)
+    assert b.get("k") is None
+    assert not os.path.exists(b._ruta("k"))
+
+
+def test_directorio_reemplazo_atomico(tmp_path):
+    b = cr.BackendDirectorio(str(tmp_path))
+    b.set("k", b"uno", 60)
+    b.set("k", b"dos", 60)
+    assert b.get("k") == b"dos"
+    assert [p.name for p in tmp_path.iterdir()] == [os.path.basename(b._ruta("k"))]
+
+
+def test_directorio_escritura_fallida_no_deja_temporales(tmp_path, monkeypatch):
+    b = cr.BackendDirectorio(str(tmp_path))
+
+    def falla(*args):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(cr.os, "replace", falla)
+    with pytest.raises(OSError):
+        b.set("k", b"abc", 60)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_directorio_archivo_corrupto_es_fallo(tmp_path):
+    b = cr.BackendDirectorio(str(tmp_path))
+    with open(b._ruta("k"), "wb") as f:
+        f.write(b"xx")
+    assert b.get("k") is None
+    assert not os.path.exists(b._ruta("k"))
+
+
+def test_directorio_limpieza_borra_otras_claves_vencidas(tmp_path, monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(cr.time, "time", lambda: ahora[0])
+    b = cr.BackendDirectorio(str(tmp_path), intervalo_limpieza=60)
+    b.set("viejo", b"abc", 10)
+    ahora[0] += 30
+    b.set("nuevo", b"def", 10)
+    assert os.path.exists(b._ruta("viejo"))  # aún no toca limpiar
+    ahora[0] += 60
+    b.set("otro", b"ghi", 100)
+    assert not os.path.exists(b._ruta("viejo"))
+    assert not os.path.exists(b._ruta("nuevo"))
+    assert b.get("otro") == b"ghi"
+
+
+def test_directorio_limpieza_temporales_y_tope(tmp_path):
+    b = cr.BackendDirectorio(str(tmp_path), max_bytes=20, edad_max_temporales=60)
+    huerfano = tmp_path / "huerfano.tmp"
+    huerfano.write_bytes(b"x")
+    reciente = tmp_path / "reciente.tmp"
+    reciente.write_bytes(b"x")
+    hace_rato = time.time() - 3600
+    os.utime(huerfano, (hace_rato, hace_rato))
+    b.set("antiguo", b"a" * 8, 60)
+    os.utime(b._ruta("antiguo"), (hace_rato, hace_rato))
+    b.set("reciente", b"b" * 8, 60)
+    b.limpiar()
+    assert not huerfano.exists()
+    assert reciente.exists()
+    assert b.get("antiguo") is None
+    assert b.get("reciente") == b"b" * 8
+
+
+# ————————————————
+# Serialización Arrow IPC
+# ————————————————
+
+def test_round_trip_tupla_con_categoricas_y_booleanas():
+    a = pd.DataFrame({"valor": [1.5, 2.0], "nombre": ["a", None]})
+    b = pd.DataFrame({
+        "vigencia": pd.Categorical(["RESERVAS", "VIGENCIA ACTUAL", "RESERVAS"]),
+        "is_gastos_root": [True, False, True],
+    })
+    res = cr._deserializar_frames(cr._serializar_frames((a, b)))
+    assert isinstance(res, tuple)
+    pd.testing.assert_frame_equal(res[0], a)
+    pd.testing.assert_frame_equal(res[1], b)
+
+
+def test_round_trip_frame_unico_y_vacio():
+    df = pd.DataFrame({"presupuesto_definitivo": pd.Series([], dtype="float64")})
+    pd.testing.assert_frame_equal(cr._deserializar_frames(cr._serializar_frames(df)), df)
+    vacio = cr._deserializar_frames(cr._serializar_frames(pd.DataFrame()))
+    assert isinstance(vacio, pd.DataFrame)
+    assert vacio.empty and len(vacio.columns) == 0
+
+
+def test_deserializar_entrada_truncada():
+    datos = cr._serializar_frames(pd.DataFrame({"a": [1, 2, 3]}))
+    with pytest.raises(ValueError):
+        cr._deserializar_frames(datos[:-5])
+
+
+# ————————————————
+# cache_compartido
+# ————————————————
+
+def _contador():
+    llamadas = []
+
+    def cargar(codigo):
+        llamadas.append(codigo)
+        return pd.DataFrame({"codigo": [codigo]})
+
+    return cargar, llamadas
+
+
+def test_cache_compartido_acierto_y_fallo(backend):
+    cargar, llamadas = _contador()
+    cargar = cr.cache_compartido(ttl=60)(cargar)
+    primero = cargar("1")
+    segundo = cargar("1")
+    assert llamadas == ["1"]
+    pd.testing.assert_frame_equal(primero, segundo)
+    cargar("2")
+    assert llamadas == ["1", "2"]
+
+
+def test_cache_compartido_sin_backend_no_guarda(monkeypatch):
+    monkeypatch.setattr(cr, "obtener_backend_cache", lambda: None)
+    cargar, llamadas = _contador()
+    cargar = cr.cache_compartido(ttl=60)(cargar)
+    cargar("1")
+    cargar("1")
+    assert llamadas == ["1", "1"]
+
+
+def test_cache_compartido_entrada_corrupta_se_descarta(backend):
+    cargar, llamadas = _contador()
+    cargar = cr.cache_compartido(ttl=60)(cargar)
+    cargar("1")
+    for clave in list(backend._entradas):
+        backend._entradas[clave] = (time.time() + 60, b"D" + struct.pack("<Q", 3) + b"abc")
+    res = cargar("1")
+    assert llamadas == ["1", "1"]
+    pd.testing.assert_frame_equal(res, pd.DataFrame({"codigo": ["1"]}))
+    pd.testing.assert_frame_equal(cargar("1"), res)
+    assert llamadas == ["1", "1"]
+
+
+def test_cache_compartido_version_distinta_no_comparte(backend, monkeypatch):
+    cargar, llamadas = _contador()
+    cr.cache_compartido(ttl=60)(cargar)("1")
+    monkeypatch.setattr(cr, "VERSION_CACHE", cr.VERSION_CACHE + 1)
+    cr.cache_compartido(ttl=60)(cargar)("1")
+    assert llamadas == ["1", "1"]
+
+
+# ————————————————
+# BackendRedis
+# ————————————————
+
+def test_redis_con_fakeredis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    b = cr.BackendRedis(cliente=fakeredis.FakeRedis())
+    b.set("k", b"abc", 60)
+    assert b.get("k") == b"abc"
+    b.delete("k")
+    assert b.get("k") is None
+
+    monkeypatch.setattr(cr, "obtener_backend_cache", lambda: b)
+    cargar, llamadas = _contador()
+    cargar = cr.cache_compartido(ttl=60)(cargar)
+    cargar("1")
+    cargar("1")
+    assert llamadas == ["1"]
@@ -0,0 +1,133 @@
+import io
+
+import pandas as pd
+import pytest
+
+import ingesta
+
+
+class _Respuesta:
+    def __init__(self, status_code=200, cuerpo=b"", headers=None):
+        self.status_code = status_code
+        self.raw = io.BytesIO(cuerpo)
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Servidor:
+    """Sirve un CSV por URL con ETag y responde 304 si el cliente lo envía."""
+
+    def __init__(self, cuerpos):
+        self.cuerpos = cuerpos
+        self.peticiones = []
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        self.peticiones.append((url, dict(headers or {})))
+        etag = f'"{url}"'
+        if (headers or {}).get("If-None-Match") == etag:
+            return _Respuesta(304)
+        return _Respuesta(200, self.cuerpos[url], {"ETag": etag})
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(ingesta.time, "time", lambda: ahora[0])
+    return ahora
+
+
+def _cliente(servidor, **kwargs):
+    cliente = ingesta.ClienteSocrata(**kwargs)
+    cliente.session.get = servidor.get
+    return cliente
+
+
+CSV_A = b"nombre_entidad,presupuesto_definitivo\nA,1\nB,2\nA,3\n"
+CSV_B = b"nombre_entidad,presupuesto_definitivo\nC,10\nD,20\n"
+
+
+def test_304_devuelve_el_frame_guardado():
+    servidor = _Servidor({"a": CSV_A})
+    cliente = _cliente(servidor)
+    primero = cliente.obtener_csv("a", {}, ["presupuesto_definitivo"])
+    segundo = cliente.obtener_csv("a", {}, ["presupuesto_definitivo"])
+    assert segundo is primero
+    assert servidor.peticiones[1][1]["If-None-Match"] == '"a"'
+    assert primero["presupuesto_definitivo"].tolist() == [1, 2, 3]
+
+
+def test_expiracion_descarta_el_frame(reloj):
+    servidor = _Servidor({"a": CSV_A})
+    cliente = _cliente(servidor, ttl_validaciones=60)
+    cliente.obtener_csv("a", {})
+    reloj[0] += 61
+    cliente.obtener_csv("a", {})
+    assert "If-None-Match" not in servidor.peticiones[1][1]
+    assert len(cliente._validaciones) == 1
+
+
+def test_304_extiende_la_expiracion(reloj):
+    servidor = _Servidor({"a": CSV_A})
+    cliente = _cliente(servidor, ttl_validaciones=60)
+    cliente.obtener_csv("a", {})
+    reloj[0] += 50
+    cliente.obtener_csv("a", {})
+    reloj[0] += 50
+    cliente.obtener_csv("a", {})
+    assert servidor.peticiones[2][1]["If-None-Match"] == '"a"'
+
+
+def test_tope_de_bytes_desaloja_el_mas_antiguo():
+    servidor = _Servidor({"a": CSV_A, "b": CSV_B})
+    sondeo = _cliente(servidor)
+    tamano_a = int(sondeo.obtener_csv("a", {}).memory_usage(deep=True).sum())
+    tamano_b = int(sondeo.obtener_csv("b", {}).memory_usage(deep=True).sum())
+
+    cliente = _cliente(servidor, max_bytes_validaciones=max(tamano_a, tamano_b) + 1)
+    cliente.obtener_csv("a", {})
+    cliente.obtener_csv("b", {})
+    assert [clave[0] for clave in cliente._validaciones] == ["b"]
+    assert cliente._bytes_validaciones == tamano_b
+
+
+def test_frame_mayor_que_el_tope_no_se_guarda():
+    servidor = _Servidor({"a": CSV_A})
+    cliente = _cliente(servidor, max_bytes_validaciones=1)
+    cliente.obtener_csv("a", {})
+    assert len(cliente._validaciones) == 0
+    assert cliente._bytes_validaciones == 0
+
+
+def test_reducir_por_bloques():
+    servidor = _Servidor({"a": CSV_A})
+    cliente = _cliente(servidor)
+
+    def sumar(df):
+        return df.groupby("nombre_entidad", as_index=False)["presupuesto_definitivo"].sum()
+
+    df = cliente.obtener_csv("a", {}, ["presupuesto_definitivo"], tamano_bloque=2, reducir=sumar)
+    esperado = pd.DataFrame({"nombre_entidad": ["A", "B"], "presupuesto_definitivo": [4, 2]})
+    pd.testing.assert_frame_equal(df, esperado)
+
+
+def test_respuesta_vacia_es_frame_vacio():
+    servidor = _Servidor({"a": b""})
+    cliente = _cliente(servidor)
+    assert cliente.obtener_csv("a", {}).empty
+
+
+def test_texto_canonico():
+    df = pd.DataFrame({"v": [" Reservas", "RESERVAS ", None, "vigencia actual"]})
+    canon = ingesta.texto_canonico(df, "v")
+    assert canon.dtype == "category"
+    assert canon.astype(str).tolist() == ["RESERVAS", "RESERVAS", "", "VIGENCIA ACTUAL"]
+    assert ingesta.texto_canonico(df, "falta").astype(str).tolist() == [""] * 4